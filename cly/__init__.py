@@ -44,15 +44,87 @@ It has the following features:
     be used in other environments (think "web-based shell" ;))
 """
 
+import sys
+from types import ModuleType
+
 
 __docformat__ = 'restructuredtext en'
 __author__ = 'Alec Thomas <alec@swapoff.org>'
-try:
-    __version__ = __import__('pkg_resources').get_distribution('cly').version
-except Exception:
-    pass
 
 
-from cly.parser import *
-from cly.builder import *
-from cly.interactive import *
+def _get_version():
+    """Return the version of the installed cly distribution, or None."""
+    try:
+        # importlib.metadata reads a single dist-info file, whereas
+        # pkg_resources scans every distribution on sys.path when imported.
+        try:
+            from importlib.metadata import version, PackageNotFoundError
+        except ImportError:
+            from importlib_metadata import version, PackageNotFoundError
+    except ImportError:
+        try:
+            return __import__('pkg_resources').get_distribution('cly').version
+        except Exception:
+            return None
+    try:
+        return version('cly')
+    except PackageNotFoundError:
+        return None
+
+
+# Public names re-exported from submodules, which are imported on first use.
+# This keeps ``import cly`` from pulling in readline for users of the parser
+# alone.
+_EXPORTS = (
+    ('cly.parser', ('HelpParser', 'Context', 'Parser')),
+    ('cly.builder', (
+        'Node', 'Masquerade', 'Defaults', 'Alias', 'Group', 'If', 'Apply',
+        'Action', 'Variable', 'Grammar', 'XMLGrammar', 'Help', 'LazyHelp',
+        'Word', 'Keyword', 'String', 'URI', 'LDAPDN', 'Integer', 'Float', 'IP',
+        'Hostname', 'Host', 'EMail', 'File', 'Boolean', 'KeyValue',
+        'AbsoluteTime', 'RelativeTime', 'Timezone', 'Base64',
+        'cull_candidates',
+        )),
+    ('cly.interactive', (
+        'Interact', 'interact', 'brief_exceptions', 'verbose_exceptions',
+        'debug_exceptions',
+        )),
+    )
+_LAZY = dict((name, module) for module, names in _EXPORTS for name in names)
+__all__ = tuple(name for _, names in _EXPORTS for name in names)
+
+
+class _LazyModule(ModuleType):
+    """The ``cly`` package, resolving ``__version__`` and submodule exports
+    on first access."""
+
+    def __getattr__(self, name):
+        if name == '__version__':
+            # Left unset, as before, if the distribution is not installed.
+            value = _get_version()
+            if value is None:
+                raise AttributeError(name)
+        elif name in _LAZY:
+            module = __import__(_LAZY[name], None, None, [name])
+            value = getattr(module, name)
+        else:
+            raise AttributeError("'module' object has no attribute '%s'"
+                                 % name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_LAZY))
+
+
+def _install():
+    module = _LazyModule(__name__)
+    module.__dict__.update(globals())
+    del module.sys, module.ModuleType, module._install
+    # Keep this module, whose globals the functions above use, alive.
+    module._original = sys.modules[__name__]
+    sys.modules[__name__] = module
+
+
+_install()
+del sys, ModuleType, _install
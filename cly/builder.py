@@ -14,9 +14,11 @@ import datetime
 import os
 import posixpath
 import re
+import sre_parse
 import warnings
+from bisect import bisect_left
+from fnmatch import translate
 from itertools import chain
-from xml.dom import minidom
 from inspect import isclass, getargspec
 from cly.exceptions import *
 from cly.parser import Context, HelpParser
@@ -26,17 +28,157 @@ try:
 except ImportError:
     pytz = None
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
 
-__all__ = [
+
+__all__ = (
     'Node', 'Masquerade', 'Defaults', 'Alias', 'Group', 'If', 'Apply', 'Action',
     'Variable', 'Grammar', 'XMLGrammar', 'Help', 'LazyHelp', 'Word', 'Keyword',
     'String', 'URI', 'LDAPDN', 'Integer', 'Float', 'IP', 'Hostname', 'Host',
     'EMail', 'File', 'Boolean', 'KeyValue', 'AbsoluteTime', 'RelativeTime',
     'Timezone', 'Base64', 'cull_candidates',
-    ]
+    )
 __docformat__ = 'restructuredtext en'
 
 
+_regex_cache = {}
+_glob_cache = {}
+_prefix_cache = {}
+_REGEX_CACHE_SIZE = 512
+
+
+def _compile(pattern):
+    """Compile a regex, caching the result.
+
+    Large grammars share a small set of patterns between many nodes, but have
+    more distinct patterns than fit in the ``re`` module's own cache.
+    """
+    key = (type(pattern), pattern)
+    try:
+        return _regex_cache[key]
+    except KeyError:
+        if len(_regex_cache) >= _REGEX_CACHE_SIZE:
+            _regex_cache.clear()
+        regex = _regex_cache[key] = re.compile(pattern)
+        return regex
+
+
+def _compile_globs(globs):
+    """Compile a sequence of shell globs to a single regex matching names that
+    :func:`fnmatch.fnmatch` would match with any of them, or None if there
+    are no globs. Results are cached."""
+    key = tuple(globs)
+    try:
+        return _glob_cache[key]
+    except KeyError:
+        if len(_glob_cache) >= _REGEX_CACHE_SIZE:
+            _glob_cache.clear()
+        regex = None
+        if key:
+            regex = re.compile('|'.join(['(?:%s)' % translate(os.path.normcase(g))
+                                         for g in key]))
+        _glob_cache[key] = regex
+        return regex
+
+
+def _literal_prefix(regex):
+    """Return the literal text every match of a compiled regex starts with.
+
+    >>> _literal_prefix(re.compile(r'show'))
+    'show'
+    >>> _literal_prefix(re.compile(r'ab+c'))
+    'a'
+    >>> _literal_prefix(re.compile(r'one|two'))
+    ''
+    >>> _literal_prefix(re.compile(r'(?i)show'))
+    ''
+    """
+    try:
+        return _prefix_cache[regex]
+    except KeyError:
+        pass
+    prefix = []
+    if not regex.flags & re.IGNORECASE:
+        char = isinstance(regex.pattern, unicode) and unichr or chr
+        for op, arg in sre_parse.parse(regex.pattern, regex.flags):
+            if op != sre_parse.LITERAL:
+                break
+            prefix.append(char(arg))
+    if len(_prefix_cache) >= _REGEX_CACHE_SIZE:
+        _prefix_cache.clear()
+    prefix = _prefix_cache[regex] = ''.join(prefix)
+    return prefix
+
+
+def _compile_patterns(target):
+    """Compile the ``pattern`` and ``separator`` regexes of a :class:`Node`
+    class or instance."""
+    pattern, separator = target.pattern, target.separator
+    target._pattern = target._separator = target._full_match = None
+    target._prefix = ''
+    if pattern is not None:
+        target._pattern = _compile(pattern)
+        target._prefix = _literal_prefix(target._pattern)
+    if separator is not None:
+        target._separator = _compile(separator)
+        if pattern is not None:
+            target._full_match = _compile('(?:%s)(?:%s)' %
+                                          (pattern, separator))
+
+
+class NodeMeta(type):
+    """Metaclass for :class:`Node`.
+
+    Compiles the class level ``pattern`` and ``separator`` once, when the class
+    is defined, so instances only compile regexes they override.
+
+    Instances of a class share its compiled pattern:
+
+    >>> Hostname()._pattern is Hostname()._pattern is Hostname._pattern
+    True
+
+    Instances overriding the pattern share regexes through a cache:
+
+    >>> Node(pattern='ab+')._pattern is Node(pattern='ab+')._pattern
+    True
+
+    Reassigning a class pattern recompiles it, and those of subclasses that
+    inherit it:
+
+    >>> class Letters(Variable):
+    ...     pattern = r'[a-z]+'
+    >>> class MoreLetters(Letters):
+    ...     pass
+    >>> Letters.pattern = r'[a-z]+:[a-z]+'
+    >>> MoreLetters._pattern.pattern
+    '[a-z]+:[a-z]+'
+    """
+    def __init__(cls, name, bases, members):
+        super(NodeMeta, cls).__init__(name, bases, members)
+        _compile_patterns(cls)
+
+    def __setattr__(cls, name, value):
+        super(NodeMeta, cls).__setattr__(name, value)
+        if name in ('pattern', 'separator'):
+            stack = [cls]
+            while stack:
+                target = stack.pop()
+                _compile_patterns(target)
+                stack.extend([sub for sub in target.__subclasses__()
+                              if name not in sub.__dict__])
+
+
 class Node(object):
     """The base class for all grammar nodes.
 
@@ -106,7 +248,10 @@ class Node(object):
         :cull_candidates:
             If ``True`` (the default) :meth:`candidates` may return a static
             list of candidates that is automatically culled based on the text
-            being matched. This avoids a lot of boiler plate code.
+            being matched. This avoids a lot of boiler plate code. A tuple
+            of candidates is indexed for prefix lookups when the node is
+            created; a list is culled afresh each time, so it may be changed
+            later.
 
             >>> a = Node(candidates=['one', 'two'])
             >>> print list(a.candidates(None, ''))
@@ -124,17 +269,26 @@ class Node(object):
             Specify the global label for this node. This can be used by the
             :class:`Alias` to refer to nodes by label rather than path.
     """
+    __metaclass__ = NodeMeta
+
     pattern = None
     separator = r'\s+|\s*$'
-    order = 0
+    _order = 0
     match_candidates = False
     cull_candidates = True
     traversals = 1
     label = None
+    # Bumped whenever any node is moved, renamed or reordered, so state
+    # derived from the shape of the whole tree can tell when it is stale.
+    _generation = 0
 
     def __init__(self, *anonymous, **kwargs):
         self._children = {}
+        self._sorted_children = None
         self._group = None
+        self._cached_path = None
+        self._cached_depth = -1
+        self.parent = None
         help = kwargs.pop('help', '')
         if isinstance(help, basestring):
             self._help = help
@@ -146,27 +300,30 @@ class Node(object):
             self.pattern = kwargs.pop('pattern')
         if 'separator' in kwargs:
             self.separator = kwargs.pop('separator')
+        static_candidates = None
         if 'candidates' in kwargs:
             candidates = kwargs.pop('candidates')
             if callable(candidates):
                 self.candidates = candidates
             else:
                 self.candidates = lambda c, t: candidates
+                static_candidates = candidates
             self.match_candidates = True
         self.cull_candidates = kwargs.pop('cull_candidates', self.cull_candidates)
         if self.cull_candidates:
-            def cull(context, text):
-                return cull_candidates(cull.candidates(context, text), text)
+            if isinstance(static_candidates, tuple):
+                index = _CandidateIndex(static_candidates)
+                def cull(context, text):
+                    return index.cull(text)
+            else:
+                def cull(context, text):
+                    return cull_candidates(cull.candidates(context, text), text)
             cull.candidates = self.candidates
             self.candidates = cull
-        if self.pattern is not None:
-            self._pattern = re.compile(self.pattern)
-        self._separator = re.compile(self.separator)
-        if self.pattern is not None and self.separator is not None:
-            self._full_match = re.compile('(?:%s)(?:%s)' %
-                                          (self.pattern, self.separator))
+        # Class level patterns are compiled by NodeMeta.
+        if 'pattern' in self.__dict__ or 'separator' in self.__dict__:
+            _compile_patterns(self)
         self.name = kwargs.pop('name', None)
-        self.parent = None
         self.__anonymous_children = 0
         self(*anonymous, **kwargs)
 
@@ -177,23 +334,45 @@ class Node(object):
 
     def _set_group(self, group):
         self._group = group
+        # Descendants may inherit the group, changing their sort order.
+        self._invalidate_subtree_caches()
 
     group = property(lambda self: self._get_group(),
                      lambda self, value: self._set_group(value))
 
+    def _set_order(self, order):
+        self._order = order
+        # Our position among our siblings may have changed.
+        Node._generation += 1
+        if self.parent is not None:
+            self.parent._sorted_children = None
+
+    order = property(lambda self: self._order,
+                     lambda self, value: self._set_order(value))
+
     def _set_name(self, name):
         """Set the name of this node.
 
         If the Node does not have an existing matching pattern associated with
         it, a pattern will be created using the name.
         """
+        old_name = self.__dict__.get('_name')
         self._name = name
+        # Keep the parent's child mapping keyed by name, for find().
+        parent = self.parent
+        if parent is not None and old_name != name and \
+                parent._children.get(old_name) is self:
+            del parent._children[old_name]
+            parent._children[name] = self
         if isinstance(name, basestring) and self.pattern is None:
             self.pattern = name
-            self._pattern = re.compile(name)
-        if self.pattern is not None and self.separator is not None:
-            self._full_match = re.compile('(?:%s)(?:%s)' %
-                                          (self.pattern, self.separator))
+            _compile_patterns(self)
+        help = self.__dict__.get('help')
+        if isinstance(help, LazyHelp) and help.node is self:
+            help._bind()
+        self._invalidate_path()
+        if self.parent is not None:
+            self.parent._sorted_children = None
     name = property(lambda self: self._name,
                     lambda self, name: self._set_name(name))
 
@@ -224,22 +403,27 @@ class Node(object):
             if not isinstance(node, Node):
                 raise InvalidAnonymousNode('"%r" must be a Node object' % node)
             # TODO Convert help to name instead of __anonymous_<n>
-            node.name = '__anonymous_%i' % self.__anonymous_children
+            # Parent is set first, so renaming also invalidates cached paths.
             node.parent = self
+            node.name = '__anonymous_%i' % self.__anonymous_children
             self._children[node.name] = node
             self.__anonymous_children += 1
 
         for k, v in options.iteritems():
             if isinstance(v, Node):
                 k = k.rstrip('_')
-                v.name = k
                 v.parent = self
+                v.name = k
                 self._children[k] = v
             else:
                 try:
                     setattr(self, k, v)
                 except AttributeError:
                     raise AttributeError('Can\'t set attribute "%s"' % k)
+        # Children may have been added, or our own sort key changed.
+        self._sorted_children = None
+        if self.parent is not None:
+            self.parent._sorted_children = None
         return self
 
     def __iter__(self):
@@ -249,17 +433,19 @@ class Node(object):
         >>> list(tree)
         [<Node:/three>, <Node:/two>]
         """
-        def nat_tokenise(key, splitter=re.compile(r'(\d+)')):
-            def convert(k):
-              if k.isdigit():
-                return int(k)
-              return k
-            return [convert(el) for el in splitter.split(key)]
-
-        children = sorted(self._children.values(),
-                          key=lambda i: (i.group, i.order, nat_tokenise(i.name)))
-        for child in children:
-            yield child
+        children = self._sorted_children
+        if children is None:
+            def nat_tokenise(key, splitter=re.compile(r'(\d+)')):
+                def convert(k):
+                  if k.isdigit():
+                    return int(k)
+                  return k
+                return [convert(el) for el in splitter.split(key)]
+
+            children = self._sorted_children = sorted(
+                self._children.values(),
+                key=lambda i: (i.group, i.order, nat_tokenise(i.name)))
+        return iter(children)
 
     def __setitem__(self, key, child):
         """Emulate dictionary set.
@@ -292,6 +478,8 @@ class Node(object):
         """
         child = self._children.pop(key)
         child.parent = None
+        child._invalidate_path()
+        self._sorted_children = None
 
     def __contains__(self, key):
         """Emulate dictionary key existence test.
@@ -309,19 +497,14 @@ class Node(object):
         >>> list(tree.walk())
         [<Node:/>, <Node:/two>, <Node:/two/four>, <Node:/two/three>]
         """
-        if predicate is None:
-            predicate = lambda node: True
-
-        def _walk(root):
-            if not predicate(root):
-                return
-            yield root
-            for node in root._children.itervalues():
-                for subnode in _walk(node):
-                    yield subnode
-
-        for node in _walk(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if predicate is not None and not predicate(node):
+                continue
             yield node
+            # Reversed so children are popped in the same order as before.
+            stack.extend(reversed(node._children.values()))
 
     def children(self, context, follow=False):
         """Iterate over child nodes, optionally follow()ing branches.
@@ -372,24 +555,39 @@ class Node(object):
         returned by ``candidates()``.
 
         Must include separator in determining whether a match was
-        successful."""
+        successful. Byte string input may be matched against unicode
+        patterns, and vice versa."""
+        # Cheaply rule out nodes whose pattern starts with literal text, such
+        # as keywords, before asking valid() or running the regex. Mixing
+        # str and unicode would coerce, and fail on non-ASCII bytes.
+        prefix = self._prefix
+        command = context.command
+        if prefix and type(prefix) is type(command) and \
+                not command.startswith(prefix, context.cursor):
+            return None
         if not self.valid(context):
             return None
         match = self._pattern.match(context.command, context.cursor)
         if match:
             # Check that separator matches as well
-            if not self._separator.match(context.command, context.cursor +
-                                         len(match.group())):
+            separator = self._separator.match(context.command, match.end())
+            if not separator:
                 return None
             if self.match_candidates and match.group() + ' ' not in \
                     self.candidates(context, match.group()):
                 return None
+            # Remember where the separator ended so advance() need not
+            # match the token a second time.
+            context._match_end = (match, separator.end())
             return match
 
     def advance(self, context):
         """Advance context cursor based on this nodes match."""
-        match = self._full_match.match(context.command, context.cursor)
-        context.advance(len(match.group()))
+        match, end = getattr(context, '_match_end', (None, 0))
+        if match is None or match is not context.trail[-1][1]:
+            match = self._full_match.match(context.command, context.cursor)
+            end = match.end()
+        context.advance(end - context.cursor)
 
     def visible(self, context):
         """Should this node be visible?"""
@@ -408,7 +606,9 @@ class Node(object):
         >>> grammar.find('/two').depth()
         1
         """
-        return self.parent and self.parent.depth() + 1 or 0
+        if self._cached_depth == -1:
+            self._cached_depth = self.parent and self.parent.depth() + 1 or 0
+        return self._cached_depth
 
     def path(self):
         """The full grammar path to this node. Path components are separated
@@ -418,13 +618,53 @@ class Node(object):
         >>> grammar.find('/two').path()
         '/two'
         """
-        names = []
-        node = self
-        while node is not None:
-            if node.name is not None:
-                names.insert(0, node.name)
-            node = node.parent
-        return '/' + '/'.join(names)
+        if self._cached_path is None:
+            names = []
+            node = self
+            while node is not None:
+                if node.name is not None:
+                    names.append(node.name)
+                node = node.parent
+            names.reverse()
+            path = '/' + '/'.join(names)
+            # Paths key traversal counts, so interned ones compare by identity.
+            if type(path) is str:
+                path = intern(path)
+            self._cached_path = path
+        return self._cached_path
+
+    def _invalidate_path(self):
+        """Forget the cached path and depth of this node and its descendants.
+
+        Must be called whenever a node is renamed or moved in the tree.
+        """
+        Node._generation += 1
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node._forget_path()
+            stack.extend(node._children.itervalues())
+
+    def _invalidate_subtree_caches(self):
+        """Forget the cached child ordering of this node, its parent and all
+        its descendants.
+
+        Must be called when the group or order of nodes in the subtree may
+        have changed.
+        """
+        Node._generation += 1
+        if self.parent is not None:
+            self.parent._sorted_children = None
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node._sorted_children = None
+            stack.extend(node._children.itervalues())
+
+    def _forget_path(self):
+        """Drop state derived from the position of this node in the tree."""
+        self._cached_path = None
+        self._cached_depth = -1
 
     def candidates(self, context, text):
         """Return an iterable of completion candidates for the given text. The
@@ -463,13 +703,18 @@ class Node(object):
     def find(self, path):
         """Find a Node by path rooted at this node.
 
-        :param path: "Path" to the node, or a label.
+        :param path: "Path" to the node, or a label. Paths are resolved
+                     from this node whether or not they start with a slash.
         :returns: Found node.
 
         >>> top = Node(name='top', one=Node(),
-        ...            two=Node(three=Node()))
+        ...            two=Node(three=Node(label='third')))
         >>> top.find('/two/three')
         <Node:/top/two/three>
+        >>> top.find('two/three')
+        <Node:/top/two/three>
+        >>> top.find('third')
+        <Node:/top/two/three>
         >>> top.find('/one/bar')
         Traceback (most recent call last):
         ...
@@ -477,18 +722,25 @@ class Node(object):
         """
         if self.label == path:
             return self
-        components = filter(None, path.split('/'))
-        if not components:
+        if '/' in path:
+            components = [c for c in path.split('/') if c]
+        elif path:
+            components = (path,)
+        else:
             return self
-        for child in self:
-            if not path.startswith('/'):
-                return child.find(path)
-            elif child.name == components[0]:
-                return child.find('/' + '/'.join(components[1:]))
+        node = self
+        for component in components:
+            node = node._children.get(component)
+            if node is None:
+                break
+        else:
+            return node
         if path.startswith('/'):
             raise InvalidNodePath(posixpath.join(self.path(), path.strip('/')))
-        else:
-            raise InvalidNodePath(path)
+        for node in self.walk():
+            if node.label == path:
+                return node
+        raise InvalidNodePath(path)
 
     def valid(self, context):
         """Is this node valid in the given context?"""
@@ -535,13 +787,8 @@ class Node(object):
         :returns: Tuple of (value, options) where options is a dictionary of
                   extra Node constructor arguments.
         """
-        casts = {
-            'traversals': int, 'group': group_cast,
-            'order': int, 'match_candidates': boolean_cast,
-            'with_context': boolean_cast,
-            }
-        if name in casts:
-            return casts[name](value), {}
+        if name in _ATTRIBUTE_CASTS:
+            return _ATTRIBUTE_CASTS[name](value), {}
 
         # Attributes that can be strings but by default have a method.
         if name == 'help' and namespace != XMLGrammar.EVAL_NS:
@@ -700,9 +947,13 @@ class Alias(Masquerade):
 
     pattern = ''
     _target = None
+    _cached_target = None
+    _resolved = None
 
     def __init__(self, target, *anonymous, **kwargs):
         self._target = target
+        self._glob = posixpath.basename(posixpath.normpath(target))
+        self._glob_re = _compile(translate(self._glob))
         Node.__init__(self, help='<alias for "%s">' % self._target,
                       *anonymous, **kwargs)
 
@@ -716,25 +967,50 @@ class Alias(Masquerade):
         if label in context.parser.labels:
             node = context.parser.labels[label]
             target = posixpath.normpath(posixpath.join(node.path(), path))
+            node, start = self._resolve(target)
         else:
             target = self.target
+            resolved = self._resolved
+            if resolved is None or resolved[0] != Node._generation:
+                resolved = self._resolved = \
+                    (Node._generation,) + self._resolve(target)
+            node, start = resolved[1:]
 
+        if node is not None:
+            yield node
+        else:
+            match = posixpath.basename(target)
+            if match == self._glob:
+                glob = self._glob_re
+            else:
+                glob = _compile(translate(match))
+            for child in start.children(context, follow=True):
+                if glob.match(child.name):
+                    yield child
+
+    def _resolve(self, target):
+        """Resolve an absolute target path.
+
+        Returns a tuple of the node at ``target`` and None or, if there is no
+        such node, None and the node whose children the glob applies to."""
         root = self
         while root.parent:
             root = root.parent
         try:
-            yield root.find(target)
+            return root.find(target), None
         except InvalidNodePath:
-            from fnmatch import fnmatch
-            start = root.find(posixpath.dirname(target))
-            match = posixpath.basename(target)
-            for child in start.children(context, follow=True):
-                if fnmatch(child.name, match):
-                    yield child
+            return None, root.find(posixpath.dirname(target))
 
     def _get_target(self):
         """Absolute (normalised) path to the aliased node."""
-        return posixpath.normpath(posixpath.join(self.path(), self._target))
+        if self._cached_target is None:
+            self._cached_target = posixpath.normpath(
+                posixpath.join(self.path(), self._target))
+        return self._cached_target
+
+    def _forget_path(self):
+        super(Alias, self)._forget_path()
+        self._cached_target = None
 
     target = property(_get_target)
 
@@ -800,15 +1076,25 @@ class Apply(Masquerade):
     def __call__(self, *anonymous, **kwargs):
         result = Node.__call__(self, *anonymous, **kwargs)
 
-        def stop_on_ancestors(node):
-            return node is self or not isinstance(node, Apply)
-
-        for child in self.walk(predicate=stop_on_ancestors):
-            if child is self:
-                Node.__call__(self, **self._apply)
-            else:
-                child(**self._apply)
+        # Settings are applied directly in a single pass. Going through
+        # Node.__call__ (and the group property) for every node would
+        # re-walk the subtree below each one to invalidate sort caches.
+        settings = self._apply.items()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for key, value in settings:
+                if key == 'group':
+                    node._group = value
+                    continue
+                try:
+                    setattr(node, key, value)
+                except AttributeError:
+                    raise AttributeError('Can\'t set attribute "%s"' % key)
+            stack.extend(child for child in node._children.itervalues()
+                         if not isinstance(child, Apply))
 
+        self._invalidate_subtree_caches()
         return result
 
 
@@ -1059,38 +1345,34 @@ class XMLGrammar(Grammar):
     def __init__(self, file, extra_nodes=None):
         super(XMLGrammar, self).__init__()
 
-        dom = minidom.parse(file)
+        grammar = ElementTree.parse(file).getroot()
 
-        nodes = [n for n in [globals()[k] for k in __all__]
-                 if isclass(n) and issubclass(n, Node)]
-        nodes.extend(extra_nodes or [])
-        self.node_map = dict([(v.__name__.lower(), v) for v in nodes])
+        self.node_map = dict(_NODE_TYPES)
+        self.node_map.update([(v.__name__.lower(), v)
+                              for v in extra_nodes or []])
         self.node_map.update([(k, self.node_map[v])
                               for k, v in self.NODE_ALIASES.items()])
 
-        grammar = dom.firstChild
-        if grammar.localName != 'grammar':
+        local_name = _split_xml_name(grammar.tag)[1]
+        if local_name != 'grammar':
             raise XMLParseError('Invalid root element "%s", expected "grammar"'
-                                % grammar.localName)
+                                % local_name)
 
         attributes = self.parse_attributes(self.__class__, grammar)
         self(**attributes)
-        self.parse_xml(self, grammar.firstChild)
+        self.parse_xml(self, grammar)
 
     def parse_xml(self, parent, xnode):
-        if not xnode:
-            return
-
-        if xnode.nodeType == minidom.Node.ELEMENT_NODE:
+        """Build nodes for the descendants of element ``xnode`` under
+        ``parent``, in document order."""
+        stack = [(parent, child) for child in reversed(xnode)]
+        while stack:
+            parent, xnode = stack.pop()
             node = self.parse_element(parent, xnode)
-        else:
-            node = parent
-
-        self.parse_xml(node, xnode.firstChild)
-        self.parse_xml(parent, xnode.nextSibling)
+            stack.extend([(node, child) for child in reversed(xnode)])
 
     def parse_element(self, parent, xnode):
-        node_name = xnode.localName.lower()
+        node_name = _split_xml_name(xnode.tag)[1].lower()
         cls = self.node_map.get(node_name)
         if not cls:
             raise XMLParseError('Invalid node type "%s"' % node_name)
@@ -1123,7 +1405,8 @@ class XMLGrammar(Grammar):
 
         attributes = {}
 
-        for (ns, k), v in xnode.attributes.itemsNS():
+        for k, v in xnode.attrib.iteritems():
+            ns, k = _split_xml_name(k)
             # Do type conversion
             k = str(aliases.get(k, k))
             v, options = cls.cast_attribute(ns, k, v)
@@ -1132,6 +1415,14 @@ class XMLGrammar(Grammar):
         return attributes
 
 
+def _split_xml_name(name):
+    """Split an ElementTree ``{namespace}local`` name into a tuple of
+    (namespace, local), where namespace is None if there isn't one."""
+    if name[:1] == '{':
+        return tuple(name[1:].split('}', 1))
+    return None, name
+
+
 def lazy_attr_evaluator(attr, positional_args=None):
     """Return a callable that lazily evaluates an expression.
 
@@ -1200,6 +1491,13 @@ def group_cast(value):
         return value
 
 
+_ATTRIBUTE_CASTS = {
+    'traversals': int, 'group': group_cast,
+    'order': int, 'match_candidates': boolean_cast,
+    'with_context': boolean_cast,
+    }
+
+
 class Help(object):
     """A callable object representing help for a Node.
 
@@ -1244,6 +1542,16 @@ class LazyHelp(Help):
     def __init__(self, node, text):
         self.node = node
         self.text = text
+        self._bind()
+
+    def _bind(self):
+        """Derive the help key from the node.
+
+        Called again by the node if it is renamed."""
+        if self.node.name == self.node.pattern:
+            self._key = self.node.name
+        else:
+            self._key = '<%s>' % self.node.name
 
     def __call__(self, context):
         """Extract help key from node.
@@ -1253,10 +1561,7 @@ class LazyHelp(Help):
         >>> [i for i in help(None)]
         [('test', 'Moo')]
         """
-        if self.node.name == self.node.pattern:
-            yield (self.node.name, self.text)
-        else:
-            yield ('<%s>' % self.node.name, self.text)
+        yield (self._key, self.text)
 
 
 class Word(Variable):
@@ -1350,7 +1655,7 @@ class URI(Variable):
     >>> parser.parse('http://www.example.com/test/;test?a=10&b=10#fragment').vars['foo']
     'http://www.example.com/test/;test?a=10&b=10#fragment'
     """
-    pattern = r"""(([a-zA-Z][0-9a-zA-Z+\\-\\.]*:)?/{0,2}[0-9a-zA-Z;/?:@&=+$\\.\\-_!~*'()%]+)(#[0-9a-zA-Z;/?:@&=+$\\.\\-_!~*'()%]+)?"""
+    pattern = r"""(?:[a-zA-Z][0-9a-zA-Z+\\-\\.]*:)?/{0,2}[0-9a-zA-Z;/?:@&=+$\\.\\-_!~*'()%]+(?:#[0-9a-zA-Z;/?:@&=+$\\.\\-_!~*'()%]+)?"""
 
     def __init__(self, scheme='', allow_fragments=1, *anonymous, **kwargs):
         Variable.__init__(self, *anonymous, **kwargs)
@@ -1398,15 +1703,20 @@ class Boolean(Variable):
     True
     >>> parser.parse('no').vars['foo']
     False
+    >>> parser.parse('Enabled').vars['foo']
+    True
     """
     TRUE = 'true yes aye enable enabled on 1'.split()
     FALSE = 'false no disable disabled off 0'.split()
 
-    pattern = r'(?i)(%s)' % '|'.join(TRUE + FALSE)
+    _TRUE_SET = frozenset(TRUE)
+
+    # Longest first, so eg. "enable" does not shadow "enabled".
+    pattern = r'(?i)(%s)' % '|'.join(sorted(TRUE + FALSE, key=len,
+                                            reverse=True))
 
     def parse(self, context, match):
-        boolean = match.group()
-        return boolean in self.TRUE
+        return match.group().lower() in self._TRUE_SET
 
 
 class Float(Variable):
@@ -1425,6 +1735,21 @@ class Float(Variable):
         return float(match.group())
 
 
+# IP address pattern that only matches valid octets, for use where the regex
+# must fall back to another alternative on an invalid address.
+_OCTET = r'(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)'
+_STRICT_IP_PATTERN = r'\.'.join([_OCTET] * 4)
+
+
+def _valid_octets(match, group):
+    """Check that the four match groups from ``group`` onwards, matched by
+    :attr:`IP.pattern`, are all valid octets."""
+    for octet in match.group(group, group + 1, group + 2, group + 3):
+        if int(octet) > 255:
+            return False
+    return True
+
+
 class IP(Variable):
     """Match an IP address.
 
@@ -1445,7 +1770,15 @@ class IP(Variable):
     >>> parser.parse('255.255.255.0').vars['foo']
     '255.255.255.0'
     """
-    pattern = r'(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)'
+    # Octet ranges are checked in match(), which is much cheaper than
+    # encoding them in the regex.
+    pattern = r'(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})'
+
+    def match(self, context):
+        match = Variable.match(self, context)
+        if match and not _valid_octets(match, 1):
+            match = None
+        return match
 
 
 class CIDR(Variable):
@@ -1459,9 +1792,17 @@ class CIDR(Variable):
     '123.34.67.89/32'
     >>> parser.parse('123.34.67.89/24').vars['foo']
     '123.34.67.89/24'
+    >>> parser.parse('123.34.67.256/24').vars
+    {}
     """
     pattern = r'(%s)(?:/(\d{1,2}))?' % IP.pattern
 
+    def match(self, context):
+        match = Variable.match(self, context)
+        if match and not _valid_octets(match, 2):
+            match = None
+        return match
+
     def parse(self, context, match):
         mask = match.group(6) or '32'
         return match.group(1) + '/' + mask
@@ -1520,7 +1861,7 @@ class Hostname(Variable):
 
     def match(self, context):
         match = Variable.match(self, context)
-        if match and self.parts and len(match.group().split('.')) < self.parts:
+        if match and self.parts and match.group().count('.') + 1 < self.parts:
             match = None
         if match and self.suffix and not match.group().endswith(self.suffix):
             match = None
@@ -1544,8 +1885,16 @@ class Host(Variable):
     '10.1.1.1'
     >>> parser.parse('1.1.10.in-addr.arpa').vars['foo']
     '1.1.10.in-addr.arpa'
+    >>> parser.parse('10.1.1.256').vars
+    {}
+
+    Hostnames may start with labels that look like an invalid IP address:
+
+    >>> parser.parse('256.1.1.1.example.com').vars['foo']
+    '256.1.1.1.example.com'
     """
-    pattern = r'(?i)(%s)|(%s)' % (IP.pattern, Hostname.pattern)
+    # The strict IP pattern lets the regex fall back to the hostname branch.
+    pattern = r'(?i)(%s)|(%s)' % (_STRICT_IP_PATTERN, Hostname.pattern)
 
 
 class EMail(Variable):
@@ -1579,36 +1928,49 @@ class File(Variable):
             return match
 
     def match_file(self, file, match_directories=True):
-        from fnmatch import fnmatch
         file = os.path.expanduser(file)
         if match_directories and os.path.isdir(file):
             return True
+        return self._match_file_name(file)
+
+    def match_file_entry(self, entry, match_directories=True):
+        """Like :meth:`match_file`, but for an entry returned by ``scandir()``,
+        whose cached file type saves a stat() per file."""
+        if match_directories and entry.is_dir():
+            return True
+        return self._match_file_name(entry.path)
+
+    def _match_file_name(self, file):
         if not self.allow_dotfiles and os.path.basename(file).startswith('.'):
             return False
-        for exclude in self.excludes:
-            if fnmatch(file, exclude):
-                return False
-        for include in self.includes:
-            if fnmatch(file, include):
-                return True
-        return False
+        name = os.path.normcase(file)
+        excludes = _compile_globs(self.excludes)
+        if excludes is not None and excludes.match(name):
+            return False
+        includes = _compile_globs(self.includes)
+        return includes is not None and includes.match(name) is not None
 
     def candidates(self, context, text):
         """Return list of valid file candidates."""
 
-        if text.startswith('~'):
-            if '/' in text:
-                short_home = text[:text.index('/')]
-            else:
-                short_home = text
-            expanded_home = os.path.expanduser(short_home)
-            text = os.path.expanduser(text)
+        short_home = None
+        if not text:
+            # Completing the first character of a path (or a directory's
+            # contents, below) needs no home expansion or basename.
+            dir, file = os.path.curdir, ''
+        elif text.endswith('/') and not text.startswith('~'):
+            dir, file = os.path.dirname(text), ''
         else:
-            short_home = None
+            if text.startswith('~'):
+                if '/' in text:
+                    short_home = text[:text.index('/')]
+                else:
+                    short_home = text
+                expanded_home = os.path.expanduser(short_home)
 
-        text = os.path.expanduser(text)
-        dir = os.path.dirname(text) or os.path.curdir
-        file = os.path.basename(text)
+            text = os.path.expanduser(text)
+            dir = os.path.dirname(text) or os.path.curdir
+            file = os.path.basename(text)
         cwd = os.path.curdir + os.path.sep
 
         def clean(file):
@@ -1619,8 +1981,11 @@ class File(Variable):
             return file
 
         def get_candidates(dir, file):
-            return [f for f in os.listdir(dir) if f.startswith(file)
-                    and self.match_file(os.path.join(dir, f))]
+            if scandir is None:
+                return [f for f in os.listdir(dir) if f.startswith(file)
+                        and self.match_file(os.path.join(dir, f))]
+            return [e.name for e in scandir(dir) if e.name.startswith(file)
+                    and self.match_file_entry(e)]
 
         candidates = get_candidates(dir, file)
         if len(candidates) == 1:
@@ -1721,20 +2086,52 @@ class Timezone(Variable):
     pattern = r'[+:/\w]+'
     match_candidates = True
 
-    if pytz:
-        def candidates(self, context, text):
-            return cull_candidates(pytz.all_timezones, text)
+    _candidate_index = None
 
+    def candidates(self, context, text):
+        # Built on first use; match_candidates looks every token up in it.
+        index = Timezone._candidate_index
+        if index is None:
+            index = Timezone._candidate_index = _CandidateIndex(
+                pytz and pytz.all_timezones or self.STATIC_TIMEZONES)
+        return index.cull(text)
+
+    if pytz:
         def parse(self, context, match):
             return pytz.timezone(match.group())
     else:
-        def candidates(self, context, text):
-            return cull_candidates(self.STATIC_TIMEZONES, text)
-
         def parse(self, context, match):
             return self.STATIC_TIMEZONES[match.group()]
 
 
+class _CandidateIndex(object):
+    """A fixed set of candidates sorted for prefix lookups, so that culling
+    costs O(log n + matches) rather than O(n).
+
+    >>> index = _CandidateIndex(['bob', 'fred', 'barry', 'harry'])
+    >>> index.cull('b')
+    ['bob ', 'barry ']
+    >>> index.cull('c')
+    []
+    """
+    def __init__(self, candidates, sep=' '):
+        self._sorted = sorted([(c, i, c.rstrip(sep) + sep)
+                               for i, c in enumerate(candidates) if c])
+
+    def cull(self, text):
+        """Equivalent to :func:`cull_candidates`, with results in their
+        original order."""
+        matches = []
+        candidates = self._sorted
+        for i in xrange(bisect_left(candidates, (text,)), len(candidates)):
+            candidate, order, culled = candidates[i]
+            if not candidate.startswith(text):
+                break
+            matches.append((order, culled))
+        matches.sort()
+        return [culled for _, culled in matches]
+
+
 def cull_candidates(candidates, text, sep=' '):
     """Cull candidates that do not start with ``text``.
 
@@ -1751,3 +2148,9 @@ def cull_candidates(candidates, text, sep=' '):
     ['bob ', 'barry ']
     """
     return [c.rstrip(sep) + sep for c in candidates if c and c.startswith(text)]
+
+
+# Element names available to XMLGrammar.
+_NODE_TYPES = dict([(n.__name__.lower(), n)
+                    for n in [globals()[k] for k in __all__]
+                    if isclass(n) and issubclass(n, Node)])
@@ -31,13 +31,15 @@ import re
 import sys
 import os
 import codecs
+import threading
+from itertools import izip_longest
 
 
-__all__ = """
+__all__ = tuple("""
 cwrite getch cerror cfatal register_codec cinfo cjustify clen cprint csplice
 cwarning cwraptext print_table rjustify termheight termwidth wraptoterm cstrip
 cencode cdecode
-""".split()
+""".split())
 
 __docformat__ = 'restructuredtext en'
 
@@ -48,6 +50,8 @@ _cstrip_re = re.compile(r'\^([N0-7BU])')
 _cwrap_re = re.compile(r'(\n)|(\s+)|((?:\^[N0-7BU]|\S)+\b[^\n^\w]*)|(.)')
 _terminal_type = None
 _terminal_colours = 0
+# Terminal dimensions from curses, cleared when the window is resized.
+_terminal_size = {}
 
 
 try:
@@ -153,6 +157,7 @@ elif _stdout_is_a_tty:
         # Reconfigure curses on window resize
         def sigwinch_handler(n, frame):
             curses.setupterm()
+            _terminal_size.clear()
 
         signal.signal(signal.SIGWINCH, sigwinch_handler)
     except:
@@ -177,7 +182,7 @@ elif _stdout_is_a_tty:
 
 
     def cwrite(io, text):
-        io.write(_decode(text)[0])
+        io.write(_codec().decode(text))
 else:
     _terminal_type = 'dumb'
 
@@ -197,6 +202,18 @@ cwrite.__doc__ = \
     """
 
 
+def _cwrite_segments(io, segments):
+    """Write each segment as if by its own :func:`cwrite` call, but with a
+    single write where the terminal type allows."""
+    if cwrite is mono_cwrite:
+        io.write(''.join([_cstrip_re.sub('', s) for s in segments]))
+    elif _terminal_type == 'ansi':
+        io.write(''.join([_codec().decode(s) for s in segments]))
+    else:
+        for segment in segments:
+            cwrite(io, segment)
+
+
 class _Codec(codecs.Codec):
     def __init__(self, *args, **kwargs):
         try:
@@ -210,15 +227,34 @@ class _Codec(codecs.Codec):
         32: '^2', 33: '^3', 34: '^4', 35: '^5', 36: '^6', 37: '^7',
     }
 
+    # Decoded colour codes, and (flag, on, off) for the toggle codes.
+    _decode_mapping = dict((c, '\033[3%sm' % c) for c in '01234567')
+    _decode_mapping['N'] = '\033[0m'
+    _BOLD, _UNDERLINE = 1, 2
+    _decode_toggles = {
+        'B': (_BOLD, '\033[1m', '\033[22m'),
+        'U': (_UNDERLINE, '\033[4m', '\033[24m'),
+    }
+
     def decode(self, input, errors='strict'):
-        return _decode_re.sub(self._decode_match, input)
+        # Every segment after a carat starts with the code it escapes, if any.
+        segments = input.split('^')
+        out = [segments[0]]
+        for segment in segments[1:]:
+            code = segment[:1]
+            if code in self._decode_mapping or code in self._decode_toggles:
+                out.append(self._decode_code(code))
+                out.append(segment[1:])
+            else:
+                out.append('^')
+                out.append(segment)
+        return ''.join(out)
 
     def encode(self, input, errors='strict'):
         return _encode_re.sub(self._encode_match, input)
 
     def reset(self):
-        self.bold = False
-        self.underline = False
+        self.flags = 0
 
     # Internal methods
     def _encode_match(self, match):
@@ -227,29 +263,16 @@ class _Codec(codecs.Codec):
             return self._encode_mapping[int(c)]
         return match.group(0)
 
-    def _decode_match(self, match):
-        c = match.group(1)
-        if c:
-            if c == 'B':
-                self.bold = not self.bold
-                if self.bold:
-                    return "\033[1m"
-                else:
-                    return "\033[22m"
-            elif c == 'U':
-                self.underline = not self.underline
-                if self.underline:
-                    return "\033[4m"
-                else:
-                    return "\033[24m"
-            elif c == 'N':
-                self.underline = self.bold = 0
-                return "\033[0m"
-            elif c >= '0' and c <= '7':
-                return "\033[3" + c + "m"
-            else:
-                return match.group(0)
-        return match.group(0)
+    def _decode_code(self, c):
+        if c in self._decode_toggles:
+            flag, on, off = self._decode_toggles[c]
+            self.flags ^= flag
+            if self.flags & flag:
+                return on
+            return off
+        if c == 'N':
+            self.flags = 0
+        return self._decode_mapping[c]
 
 
 class _CodecStreamWriter(_Codec, codecs.StreamWriter):
@@ -286,12 +309,25 @@ class _CodecStreamReader(_Codec, codecs.StreamReader):
         self.reset()
 
 
+_thread_codecs = threading.local()
+
+
+def _codec():
+    """Return this thread's stateless conversion codec, reset."""
+    try:
+        codec = _thread_codecs.codec
+    except AttributeError:
+        codec = _thread_codecs.codec = _Codec()
+    codec.reset()
+    return codec
+
+
 def _decode(input, errors='strict'):
-    return (_Codec(errors=errors).decode(input), len(input))
+    return (_codec().decode(input), len(input))
 
 
 def _encode(input, errors='strict'):
-    return (_Codec(errors=errors).encode(input), len(input))
+    return (_codec().encode(input), len(input))
 
 
 def register_codec():
@@ -332,7 +368,13 @@ def cprint(*args):
         args = args[1:]
     else:
         stream = sys.stdout
-    cwrite(stream, ' '.join(map(str, args)) + '\n')
+    cwrite(stream, _cformat('', args, '\n'))
+
+
+def _cformat(prefix, args, suffix='^N'):
+    """Join args as ``print`` would, between prefix and suffix."""
+    return prefix + ' '.join([a if type(a) is str else str(a)
+                              for a in args]) + suffix
 
 
 def cstrip(text):
@@ -347,23 +389,23 @@ def clen(arg):
 
 def cerror(*args):
     """Print a message in red to stderr."""
-    cprint(sys.stderr, "^1^B" + ' '.join(map(str, args)) + '^N')
+    cprint(sys.stderr, _cformat('^1^B', args))
 
 
 def cfatal(*args):
     """Print a message in red to stderr then exit with status -1."""
-    cprint(sys.stderr, "^1^B" + ' '.join(map(str, args)) + '^N')
+    cprint(sys.stderr, _cformat('^1^B', args))
     sys.exit(-1)
 
 
 def cwarning(*args):
     """Print a yellow warning message to stderr."""
-    cprint(sys.stderr, "^3^B" + ' '.join(map(str, args)) + '^N')
+    cprint(sys.stderr, _cformat('^3^B', args))
 
 
 def cinfo(*args):
     """Print a green notice."""
-    cprint("^2" + ' '.join(map(str, args)) + '^N')
+    cprint(_cformat('^2', args))
 
 
 def termwidth():
@@ -371,13 +413,7 @@ def termwidth():
 
     Returns -1 if the terminal width can not be determined.
     """
-    if not _stdout_is_a_tty:
-        return -1
-    try:
-        import curses
-        return curses.tigetnum('cols')
-    except:
-        return int(os.environ.get('COLUMNS', -1))
+    return _terminal_dimension('cols', 'COLUMNS')
 
 
 def termheight():
@@ -385,18 +421,29 @@ def termheight():
 
     Returns -1 if the terminal height can not be determined.
     """
+    return _terminal_dimension('lines', 'LINES')
+
+
+def _terminal_dimension(capability, variable):
+    """Look up a numeric terminfo capability, falling back to an environment
+    variable."""
     if not _stdout_is_a_tty:
         return -1
+    try:
+        return _terminal_size[capability]
+    except KeyError:
+        pass
     try:
         import curses
-        return curses.tigetnum('lines')
+        value = _terminal_size[capability] = curses.tigetnum(capability)
+        return value
     except:
-        return int(os.environ.get('LINES', -1))
+        return int(os.environ.get(variable, -1))
 
 
 def csplice(text, start=0, end=-1):
     """Splice a colour encoded string."""
-    out = ''
+    out = []
     if end == -1:
         end = len(text)
     sofar = 0
@@ -405,23 +452,75 @@ def csplice(text, start=0, end=-1):
         txt = token.group(0)
         if token.group(1):
             if start < sofar < end:
-                out += txt
+                out.append(txt)
         else:
+            txt_end = sofar + len(txt)
             # Whether beginning and end of segment are in slice
             bs = start < sofar < end
-            es = start < sofar + len(txt) < end
+            es = start < txt_end < end
             if bs and es:
-                out += txt
+                out.append(txt)
             elif not bs and es:
-                out += txt[start - sofar:]
+                out.append(txt[start - sofar:])
             elif bs and not es:
-                out += txt[:end - sofar]
+                out.append(txt[:end - sofar])
                 break
-            elif sofar <= start and sofar + len(txt) >= end:
-                out += txt[start - sofar:end]
+            elif sofar <= start and txt_end >= end:
+                out.append(txt[start - sofar:end])
                 break
-            sofar += len(txt)
-    return out
+            sofar = txt_end
+    return ''.join(out)
+
+
+def _csplit(text, width):
+    """Split a colour encoded string at width.
+
+    Equivalent to ``(csplice(text, 0, width), csplice(text, width))``, but
+    scans the text once.
+    """
+    head, tail = [], []
+    end = len(text)
+    head_done = False
+    sofar = 0
+    for token in _decode_re.finditer(text):
+        txt = token.group(0)
+        head_done = head_done or sofar > width
+        if token.group(1):
+            if not head_done and 0 < sofar < width:
+                head.append(txt)
+            if width < sofar < end:
+                tail.append(txt)
+            continue
+        txt_end = sofar + len(txt)
+        if not head_done:
+            bs = 0 < sofar < width
+            es = 0 < txt_end < width
+            if es:
+                head.append(txt[max(0, -sofar):])
+            elif bs:
+                head.append(txt[:width - sofar])
+                head_done = True
+            elif sofar <= 0 and txt_end >= width:
+                head.append(txt[-sofar:width])
+                head_done = True
+        bs = width < sofar < end
+        es = width < txt_end < end
+        if bs and es:
+            tail.append(txt)
+        elif not bs and es:
+            tail.append(txt[width - sofar:])
+        elif bs and not es:
+            tail.append(txt[:end - sofar])
+            break
+        elif sofar <= width and txt_end >= end:
+            tail.append(txt[width - sofar:end])
+            break
+        sofar = txt_end
+    return ''.join(head), ''.join(tail)
+
+
+_cwrap_cache = {}
+_CWRAP_CACHE_SIZE = 1024
 
 
 def cwraptext(rtext, width=None, subsequent_indent=''):
@@ -430,16 +529,33 @@ def cwraptext(rtext, width=None, subsequent_indent=''):
         width = termwidth()
         if width == -1:
             return [rtext]
+    # Help and tables are wrapped again each time they are displayed.
+    key = (type(rtext), rtext, width, subsequent_indent)
+    try:
+        lines = _cwrap_cache[key]
+    except KeyError:
+        if len(_cwrap_cache) >= _CWRAP_CACHE_SIZE:
+            _cwrap_cache.clear()
+        lines = _cwrap_cache[key] = tuple(_cwraptext(rtext, width,
+                                                     subsequent_indent))
+    return list(lines)
+
+
+def _cwraptext(rtext, width, subsequent_indent):
     out = []
     for text in rtext.splitlines():
-        tokens = [t.group(0) for t in _cwrap_re.finditer(text)] + [' ' * width]
-        line = tokens.pop(0)
+        # A stack of (token, length, stripped length), consumed from the end.
+        tokens = [(token, clen(token), clen(token.rstrip())) for token in
+                  reversed([t.group(0) for t in _cwrap_re.finditer(text)])]
+        tokens.insert(0, (' ' * width, width, 0))
+        line, line_len, _ = tokens.pop()
         first_line = 1
 
         def add_line(line, first_line):
             if clen(line.rstrip()) > width:
-                tokens.insert(0, csplice(line, width))
-                line = csplice(line, 0, width)
+                # Only a single token can be wider than the line.
+                line, rest = _csplit(line, width)
+                tokens.append((rest, clen(rest), clen(rest.rstrip())))
             out.append((not first_line and subsequent_indent or '') + line.rstrip())
             first_line = 0
             if not out[-1]:
@@ -448,11 +564,13 @@ def cwraptext(rtext, width=None, subsequent_indent=''):
 
         if tokens:
             while tokens:
-                if clen(line) + clen(tokens[0].rstrip()) > width:
+                if line_len + tokens[-1][2] > width:
                     first_line = add_line(line, first_line)
-                    line = tokens.pop(0)
+                    line, line_len, _ = tokens.pop()
                 else:
-                    line += tokens.pop(0)
+                    token, token_len, _ = tokens.pop()
+                    line += token
+                    line_len += token_len
             if line:
                 add_line(line, first_line)
         else:
@@ -524,15 +642,16 @@ def print_table(header, table, sep=u' ', indent=u'', expand_to_fit=True,
     seplen = len(sep)
     # Normalise rows
     rows = [map(unicode, r) for r in [list(header)] + list(table)]
+    lengths = [map(ctlen, r) for r in rows]
     columns = len(rows[0])
 
     # Scale size_hints percentages to terminal width
     if term_width is None:
         term_width = termwidth()
         if term_width == -1:
-            term_width = max([sum(map(ctlen, r)) + len(r) for r in rows])
+            term_width = max([sum(r) + len(r) for r in lengths])
             min_widths = reduce(lambda a, b: map(max, zip(a, b)),
-                                [map(lambda c: ctlen(c) + 1, r) for r in rows])
+                                [[l + 1 for l in r] for r in lengths])
         else:
             term_width = term_width - (columns - 1) * seplen - ctlen(indent)
     if not isinstance(min_widths, dict):
@@ -542,9 +661,10 @@ def print_table(header, table, sep=u' ', indent=u'', expand_to_fit=True,
     avg_width = float(term_width) / columns
     # Use the mid-point between the maximum word width and the maximum length
     # of the column.
-    widths = [(max([ctlen(w) for cell in column for w in cell.split()])
-               + max(map(ctlen, column))) / 2 + seplen
-              for column in zip(*rows)]
+    word_lengths = [[max([0] + [ctlen(w) for w in c.split()]) for c in r]
+                    for r in rows]
+    widths = [(max(words) + max(cells)) / 2 + seplen
+              for cells, words in zip(zip(*lengths), zip(*word_lengths))]
     #widths = [int(min(c, avg_width)) for c in widths]
     # Apply user-specified column widths.
     widths = [max(c, min_widths.get(i, 1)) for i, c in enumerate(widths)]
@@ -567,20 +687,15 @@ def print_table(header, table, sep=u' ', indent=u'', expand_to_fit=True,
 
         wrapped = [cwraptext(c.replace('^R', format), widths[i])
                    for i, c in enumerate(row)]
-        maxrows = max([0] + map(len, wrapped))
-        for col in wrapped:
-            col += [''] * (maxrows - len(col))
 
         prefix = indent + format
-        for y in range(len(wrapped[0])):
-            cwrite(sys.stdout, prefix)
-            for x, cell in enumerate(wrapped):
-                cwrite(sys.stdout, cell[y].ljust(widths[x]))
-                if x < columns - 1:
-                    cwrite(sys.stdout, ' ')
-                else:
-                    cwrite(sys.stdout, '\n')
-            cwrite(sys.stdout, '^N')
+        for cells in izip_longest(fillvalue='', *wrapped):
+            line = [prefix]
+            for x, cell in enumerate(cells):
+                line.append(cell.ljust(widths[x]))
+                line.append(x < columns - 1 and ' ' or '\n')
+            line.append('^N')
+            _cwrite_segments(sys.stdout, line)
 
 
 if __name__ == '__main__':
@@ -12,9 +12,9 @@
 import string
 
 
-__all__ = ['Error', 'InvalidHelp', 'InvalidNodePath', 'InvalidAnonymousNode',
+__all__ = ('Error', 'InvalidHelp', 'InvalidNodePath', 'InvalidAnonymousNode',
            'ParseError', 'UnexpectedEOL', 'InvalidToken', 'ValidationError',
-           'XMLParseError']
+           'XMLParseError')
 __docformat__ = 'restructuredtext en'
 
 
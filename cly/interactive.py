@@ -20,6 +20,7 @@ customisable completion key, interactive help and more.
 import os
 import sys
 import types
+from collections import OrderedDict
 import cly.console as console
 from cly.exceptions import Error, ParseError
 from cly.builder import Grammar
@@ -39,8 +40,8 @@ except ImportError:
         pyreadline = None
 
 
-__all__ = ['Interact', 'interact', 'brief_exceptions', 'verbose_exceptions',
-           'debug_exceptions']
+__all__ = ('Interact', 'interact', 'brief_exceptions', 'verbose_exceptions',
+           'debug_exceptions')
 __docformat__ = 'restructuredtext en'
 
 
@@ -84,6 +85,7 @@ class InputDriver(object):
 
     def _set_prompt(self, prompt):
         self._prompt = prompt
+        self._prompt_len = len(prompt)
 
     def _get_prompt(self):
         return self._prompt
@@ -91,6 +93,16 @@ class InputDriver(object):
     prompt = property(lambda self: self._get_prompt(),
                       lambda self, prompt: self._set_prompt(prompt))
 
+    def _get_prompt_width(self):
+        """Displayed width of the prompt."""
+        # Drivers overriding _set_prompt() may not record the width.
+        try:
+            return self._prompt_len
+        except AttributeError:
+            return len(self.prompt)
+
+    prompt_width = property(_get_prompt_width, doc=_get_prompt_width.__doc__)
+
 
 class DumbInput(InputDriver):
     """The horror."""
@@ -105,6 +117,10 @@ class DumbInput(InputDriver):
         return True
 
 
+# Parses kept per input line by ReadlineDriver.
+_PARSE_CACHE_SIZE = 64
+
+
 class ReadlineDriver(InputDriver):
     """Base class for readline variants."""
 
@@ -112,6 +128,8 @@ class ReadlineDriver(InputDriver):
         super(ReadlineDriver, self).__init__(*args, **kwargs)
         self._cli_inject_text = ''
         self._completion_candidates = []
+        self._parse_cache = OrderedDict()
+        self._last_candidates = (None, None, ())
 
     def enter(self):
         try:
@@ -128,6 +146,9 @@ class ReadlineDriver(InputDriver):
         self._bind_help()
 
     def input(self):
+        # The grammar or its data may change between commands.
+        self._parse_cache.clear()
+        self._last_candidates = (None, None, ())
         return raw_input(self.prompt)
 
     def leave(self):
@@ -161,24 +182,47 @@ class ReadlineDriver(InputDriver):
 
     def _set_prompt(self, prompt):
         self._prompt = console.cdecode(prompt)
+        # Displayed width, excluding escape sequences.
+        self._prompt_len = console.clen(prompt)
 
     # Internal methods
+    def _parse(self, command):
+        """Parse command, reusing recent results for the current input line
+        (readline asks for candidates and help repeatedly, and the cursor
+        moves back and forth over the same prefixes)."""
+        cache = self._parse_cache
+        context = cache.pop(command, None)
+        if context is None:
+            context = self.parser.parse(command)
+            if len(cache) >= _PARSE_CACHE_SIZE:
+                cache.popitem(last=False)
+        cache[command] = context
+        return context
+
     def _completion(self, text, state):
-        line = readline.get_line_buffer()[0:readline.get_begidx()]
-        ctx = None
         try:
-            result = self.parser.parse(line)
+            # Readline calls back with increasing state for each candidate,
+            # which are all collected on the first call.
             if not state:
-                try:
-                    self._completion_candidates = list(result.candidates(text))
-                except Exception, e:
-                    Interact.dump_traceback(e)
-                    self._force_redisplay()
-                    raise
+                line = readline.get_line_buffer()[0:readline.get_begidx()]
+                # Only an exact repeat (eg. a second tab to list candidates)
+                # can reuse the last result: candidates for a longer text are
+                # not always a subset, as File descends into a directory once
+                # it is the only match.
+                if self._last_candidates[:2] != (line, text):
+                    result = self._parse(line)
+                    try:
+                        candidates = tuple(result.candidates(text))
+                    except Exception, e:
+                        Interact.dump_traceback(e)
+                        self._force_redisplay()
+                        raise
+                    self._last_candidates = (line, text, candidates)
+                self._completion_candidates = list(self._last_candidates[2])
             if self._completion_candidates:
                 return self._completion_candidates.pop()
             return None
-        except cly.Error:
+        except Error:
             return None
 
     def _redraw_input(self):
@@ -188,19 +232,19 @@ class ReadlineDriver(InputDriver):
     def _show_help(self, key, count):
         try:
             command = readline.get_line_buffer()[:self.cursor]
-            context = self.parser.parse(command)
+            context = self._parse(command)
             if context.remaining.strip():
                 print
                 candidates = [help[1] for help in context.help()]
                 text = '%s^ invalid token (candidates are %s)' % \
-                       (' ' * (context.cursor + len(self.prompt)),
+                       (' ' * (context.cursor + self.prompt_width),
                        ', '.join(candidates))
                 console.cerror(text)
                 self._force_redisplay()
                 return
             help = context.help()
-            print
-            console.cprint('\n'.join(help.format()))
+            # Leading newline moves off the input line in the same write.
+            console.cprint('\n' + '\n'.join(help.format()))
             self._force_redisplay()
             return 0
         except Exception, e:
@@ -375,7 +419,7 @@ class Interact(object):
         text = str(text)
         term_width = console.termwidth()
         indent = ' ' * (context.cursor % term_width
-                        + len(self.prompt))
+                        + self.input_driver.prompt_width)
         if len(indent + text) > term_width:
             console.cerror(indent + '^')
             console.cerror(text)
@@ -12,13 +12,31 @@ Constructs for parsing user input with a :class:`~cly.builder.Grammar`.
 """
 
 
-__all__ = ['HelpParser', 'Context', 'Parser']
+__all__ = ('HelpParser', 'Context', 'Parser')
 __docformat__ = 'restructuredtext en'
 
 
 from cly.exceptions import *
 
 
+_HELP_CACHE_SIZE = 256
+
+
+def _help_cache_key(node, children):
+    """Key help for node by the visible children and everything that feeds
+    into their default help, or None if any child computes its own help."""
+    from cly.builder import Node
+    default_help = Node.help.im_func
+    signature = []
+    for child in children:
+        if 'help' in child.__dict__ or \
+                getattr(type(child).help, 'im_func', None) is not default_help:
+            return None
+        signature.append((child, child.group, child.order, child.name,
+                          child.pattern, child._help))
+    return (node, tuple(signature))
+
+
 class HelpParser(object):
     """Extract the help for children of the specified Node.
 
@@ -28,6 +46,21 @@ class HelpParser(object):
     def __init__(self, context, node):
         self.help = []
         self.node = node
+        # Width of the widest help key, for format().
+        self._max_len = 0
+
+        children = [child for child in context._children(node)
+                    if child.visible(context)]
+        parser = context.parser
+        key = None
+        if parser is not None:
+            key = _help_cache_key(node, children)
+            if key is not None:
+                cached = parser._help_cache.get(key)
+                if cached is not None:
+                    self.help = list(cached[0])
+                    self._max_len = cached[1]
+                    return
 
         def parse_help(node):
             help = node.help(context)
@@ -39,17 +72,24 @@ class HelpParser(object):
             else:
                 return help
 
-        def add_help(node):
-            node_help = sorted(parse_help(node))
-            for help in node_help:
-                self.help.append((node.group, node.order, help[0], help[1]))
-
-        for child in node.children(context, follow=True):
-            if child.visible(context):
-                add_help(child)
+        # A single sort over the whole list orders each node's own entries
+        # too, so they are not sorted separately first.
+        max_len = 0
+        for child in children:
+            group, order = child.group, child.order
+            for help in parse_help(child):
+                self.help.append((group, order, help[0], help[1]))
+                if len(help[0]) > max_len:
+                    max_len = len(help[0])
+        self._max_len = max_len
 
         self.help.sort()
 
+        if key is not None:
+            if len(parser._help_cache) >= _HELP_CACHE_SIZE:
+                parser._help_cache.clear()
+            parser._help_cache[key] = (tuple(self.help), max_len)
+
     def __iter__(self):
         """Iterate over each (order, key, help) help tuple.
 
@@ -92,13 +132,14 @@ class HelpParser(object):
         if not self.help:
             return []
         last_group = None
-        max_len = max([len(h[2]) for h in self.help])
+        # Fix the column width in the template once rather than per row.
+        template = '  ^B%%-%ds^B %%s' % self._max_len
         out = []
         for group, order, command, help in self.help:
             if last_group is not None and last_group != group:
                 out.append('')
             last_group = group
-            out.append('  ^B%-*s^B %s' % (max_len, command, help))
+            out.append(template % (command, help))
         return out
 
 
@@ -146,6 +187,10 @@ class Context(object):
         self.data = data
         self.vars = {}
         self._traversed = {}
+        self._match_end = (None, 0)
+        self._children_cache = {}
+        self._children_generation = None
+        self._last_node_cache = (None, None)
         self.trail = []
 
     def _get_remaining_input(self):
@@ -179,10 +224,16 @@ class Context(object):
         >>> context.last_node
         <Node:/one/two>
         """
-        if self.trail[-1][1] is None or self.trail[-1][1].group():
-            return self.trail[-1][0]
-        else:
-            return self.trail[-2][0]
+        # Valid for as long as the trail ends with the same entry.
+        last = self.trail[-1]
+        entry, node = self._last_node_cache
+        if entry is not last:
+            if last[1] is None or last[1].group():
+                node = last[0]
+            else:
+                node = self.trail[-2][0]
+            self._last_node_cache = (last, node)
+        return node
     last_node = property(_last_node, doc=_last_node.__doc__)
 
     def execute(self):
@@ -212,10 +263,27 @@ class Context(object):
         4
         """
         self.cursor += distance
+        self._children_cache.clear()
+
+    def _children(self, node):
+        """Followed children of node, memoised until the parse moves on.
+
+        Completion and help can ask for the same children several times.
+        """
+        from cly.builder import Node
+        if self._children_generation != Node._generation:
+            # The grammar has changed shape since the children were cached.
+            self._children_cache.clear()
+            self._children_generation = Node._generation
+        children = self._children_cache.get(node)
+        if children is None:
+            children = list(node.children(self, follow=True))
+            self._children_cache[node] = children
+        return children
 
     def candidates(self, text=None):
-        """Return potential candidates from children of last successfully
-        parsed node.
+        """Return a list of potential candidates from children of last
+        successfully parsed node.
 
         Arguments:
             :text: If provided, return candidates after ``text``, otherwise the
@@ -232,9 +300,11 @@ class Context(object):
         """
         if text is None:
             text = self.remaining
-        for child in self.last_node.children(self, follow=True):
-            for candidate in child.candidates(self, text):
-                yield candidate
+        candidates = []
+        extend = candidates.extend
+        for child in self._children(self.last_node):
+            extend(child.candidates(self, text))
+        return candidates
 
     def help(self):
         """Return a HelpParser object describing the last successfully parsed
@@ -255,8 +325,8 @@ class Context(object):
     def selected(self, node):
         """The given node has been selected and will be followed."""
         path = node.path()
-        self._traversed.setdefault(path, 0)
-        self._traversed[path] += 1
+        self._traversed[path] = self._traversed.get(path, 0) + 1
+        self._children_cache.clear()
 
     def traversed(self, node):
         """How many times has node been traversed in this context?
@@ -309,6 +379,7 @@ class Parser(object):
         from cly.builder import Grammar
         assert isinstance(grammar, Grammar)
         self._grammar = grammar
+        self._help_cache = {}
 
     def _get_grammar(self):
         """The :class:`~cly.builder.Grammar` associated with this parser."""
@@ -343,24 +414,22 @@ class Parser(object):
         if data is None:
             data = self.data
         context = self.context_factory(self, command, data)
-
-        def parse(node, match):
-            context.trail.append((node, match))
+        trail = context.trail
+        node, match = self.grammar, None
+        while True:
+            trail.append((node, match))
             if match is not None:
                 node.advance(context)
             node.selected(context, match)
 
             for subnode in node.next(context):
                 if subnode.valid(context):
-                    submatch = subnode.match(context)
-                    if submatch is not None:
-                        return parse(subnode, submatch)
+                    match = subnode.match(context)
+                    if match is not None:
+                        node = subnode
+                        break
             else:
-                return
-            raise InvalidToken(context)
-
-        parse(self.grammar, None)
-        return context
+                return context
 
     def merge(self, grammar, where=None):
         """Merge another grammar into this one.
@@ -377,6 +446,7 @@ class Parser(object):
         where = self.find(where)
         where.update(grammar)
         self.labels.update(self._collect_labels())
+        self._help_cache.clear()
 
     def execute(self, command, data=None):
         """Parse and execute the given command.
@@ -395,13 +465,17 @@ class Parser(object):
         return self.parse(command, data).execute()
 
     def find(self, path):
-        """Find a node by its absolute path.
+        """Find a node by its absolute path or label.
 
         >>> from cly.builder import Grammar, Node, Action
-        >>> parser = Parser(Grammar(one=Node(), two=Node(three=Node())))
+        >>> parser = Parser(Grammar(one=Node(), two=Node(three=Node(label='x'))))
         >>> parser.find('/two/three')
         <Node:/two/three>
+        >>> parser.find('x')
+        <Node:/two/three>
         """
+        if path in self.labels:
+            return self.labels[path]
         return self.grammar.find(path)
 
     def _collect_labels(self):
@@ -6,11 +6,13 @@
 # you should have received as part of this distribution.
 #
 
+import sys
 import unittest
 import doctest
 from StringIO import StringIO
-from cly.exceptions import InvalidToken
-from cly import Defaults, Node, XMLGrammar, Parser
+from cly.exceptions import InvalidNodePath, InvalidToken
+from cly import Alias, Defaults, Grammar, Group, Node, XMLGrammar, Parser
+from cly.parser import Context
 
 
 class TestXMLGrammar(unittest.TestCase):
@@ -210,6 +212,169 @@ class TestXMLGrammar(unittest.TestCase):
         self.assertEqual(parser.parse('test').vars,
                          {'foo': 20, 'baz': 10, 'waz': 'waz'})
 
+    def test_wide_grammar(self):
+        xml = StringIO('<?xml version="1.0"?>\n<grammar>%s</grammar>' %
+                       ''.join(['<node name="n%i"/>' % i
+                                for i in range(3000)]))
+        grammar = XMLGrammar(xml)
+        self.assertEqual(len(list(grammar)), 3000)
+        self.assertEqual(grammar.find('/n2999').path(), '/n2999')
+
+    def test_eval_namespace(self):
+        xml = StringIO("""<?xml version="1.0"?>
+        <grammar xmlns="http://swapoff.org/cly/xml"
+                 xmlns:e="http://swapoff.org/cly/xml/eval">
+            <node name="echo" e:help="echo_help"/>
+        </grammar>
+        """)
+        grammar = XMLGrammar(xml)
+        parser = Parser(grammar, data={'echo_help': [('echo', 'Echo text')]})
+        self.assertEqual(list(parser.parse('').help()),
+                         [(0, 'echo', 'Echo text')])
+
+
+class TestNode(unittest.TestCase):
+    """Test grammar node behaviour."""
+    def test_order_resorts_parent(self):
+        grammar = Grammar(a=Node(), b=Node())
+        self.assertEqual([n.name for n in grammar], ['a', 'b'])
+        grammar.find('/b').order = -1
+        self.assertEqual([n.name for n in grammar], ['b', 'a'])
+
+    def test_match_mixed_string_types(self):
+        parser = Parser(Grammar(**{u'show': Node()}))
+        self.assertEqual(parser.parse('\xc3\xa9t\xc3\xa9').remaining,
+                         '\xc3\xa9t\xc3\xa9')
+        self.assertEqual(parser.parse('show').remaining, '')
+
+    def test_find_label(self):
+        grammar = Grammar(one=Node(label='x'))
+        self.assertEqual(grammar.find('x'), grammar.find('/one'))
+        self.assertRaises(InvalidNodePath, grammar.find, '/x')
+
+    def test_find_relative_path(self):
+        grammar = Grammar(one=Node(two=Node()))
+        self.assertEqual(grammar.find('one/two'), grammar.find('/one/two'))
+        self.assertRaises(InvalidNodePath, grammar.find, 'one/three')
+
+    def test_find_renamed(self):
+        grammar = Grammar(one=Node(two=Node()))
+        grammar.find('/one').name = 'uno'
+        self.assertEqual(grammar.find('/uno/two').path(), '/uno/two')
+        self.assertRaises(InvalidNodePath, grammar.find, '/one')
+
+    def test_mutable_candidates(self):
+        candidates = ['alpha', 'beta']
+        node = Node(candidates=candidates)
+        self.assertEqual(list(node.candidates(None, 'g')), [])
+        candidates.append('gamma')
+        self.assertEqual(list(node.candidates(None, 'g')), ['gamma '])
+
+    def test_tuple_candidates(self):
+        node = Node(candidates=('alpha', 'beta', 'bravo'))
+        self.assertEqual(list(node.candidates(None, 'b')), ['beta ', 'bravo '])
+
+
+class TestCacheInvalidation(unittest.TestCase):
+    """Test that cached grammar state tracks changes to the grammar."""
+    def test_path_and_depth(self):
+        grammar = Grammar(one=Node(two=Node()), three=Node())
+        two = grammar.find('/one/two')
+        self.assertEqual((two.path(), two.depth()), ('/one/two', 2))
+        grammar.find('/one').name = 'uno'
+        self.assertEqual((two.path(), two.depth()), ('/uno/two', 2))
+        del grammar['uno']['two']
+        self.assertEqual((two.path(), two.depth()), ('/two', 0))
+        grammar['three']['four'] = two
+        self.assertEqual((two.path(), two.depth()), ('/three/four', 2))
+
+    def test_alias_resolution(self):
+        grammar = Grammar(one=Node(), two=Node(alias=Alias(target='/one')))
+        alias = grammar.find('/two/alias')
+        context = Context(Parser(grammar), None)
+        self.assertEqual(list(alias.follow(context)), [grammar.find('/one')])
+        grammar.find('/one').name = 'uno'
+        self.assertEqual(list(alias.follow(context)), [])
+        grammar['one'] = Node()
+        self.assertEqual(list(alias.follow(context)), [grammar.find('/one')])
+        del grammar['one']
+        self.assertEqual(list(alias.follow(context)), [])
+        grammar(one=Group(3)(Node()))
+        self.assertEqual(list(alias.follow(context)), [grammar.find('/one')])
+
+    def test_alias_glob_resolution(self):
+        grammar = Grammar(one=Node(a=Node(), b=Node()),
+                          alias=Alias(target='/one/*'))
+        alias = grammar.find('/alias')
+        context = Context(Parser(grammar), None)
+        names = lambda: [n.name for n in alias.follow(context)]
+        self.assertEqual(names(), ['a', 'b'])
+        grammar['one']['c'] = Node()
+        self.assertEqual(names(), ['a', 'b', 'c'])
+        del grammar['one']['a']
+        self.assertEqual(names(), ['b', 'c'])
+        grammar.find('/one/c').group = -1
+        self.assertEqual(names(), ['c', 'b'])
+
+    def test_parse(self):
+        grammar = Grammar(one=Node(two=Node()))
+        parser = Parser(grammar)
+        last_path = lambda command: parser.parse(command).last_node.path()
+        self.assertEqual(last_path('one two'), '/one/two')
+        grammar.find('/one/two').name = 'three'
+        self.assertEqual(last_path('one two'), '/one/three')
+        del grammar['one']['three']
+        self.assertEqual(last_path('one two'), '/one')
+        grammar['one']['four'] = Node()
+        self.assertEqual(last_path('one four'), '/one/four')
+        grammar['one'].group = 1
+        grammar['five'] = Node(Alias(target='/one/*'))
+        self.assertEqual(last_path('five four'), '/one/four')
+
+    def test_help(self):
+        grammar = Grammar(one=Node(help='1'), two=Node(help='2'))
+        parser = Parser(grammar)
+        keys = lambda: [h[1] for h in parser.parse('').help()]
+        self.assertEqual(keys(), ['one', 'two'])
+        grammar.find('/one').name = 'uno'
+        self.assertEqual(keys(), ['<uno>', 'two'])
+        grammar['three'] = Node(help='3')
+        self.assertEqual(keys(), ['<uno>', 'three', 'two'])
+        del grammar['uno']
+        self.assertEqual(keys(), ['three', 'two'])
+        grammar.find('/two').group = -1
+        self.assertEqual(keys(), ['two', 'three'])
+
+    def test_context_children(self):
+        grammar = Grammar(one=Node(a=Node(), b=Node()))
+        context = Parser(grammar).parse('one ')
+        self.assertEqual(context.candidates(), ['a ', 'b '])
+        self.assertEqual([h[1] for h in context.help()], ['a', 'b'])
+        grammar['one']['c'] = Node()
+        self.assertEqual(context.candidates(), ['a ', 'b ', 'c '])
+        grammar.find('/one/a').name = 'd'
+        self.assertEqual([h[1] for h in context.help()], ['<d>', 'b', 'c'])
+        del grammar['one']['b']
+        self.assertEqual(context.candidates(), ['c '])
+        grammar.find('/one/c').group = -1
+        self.assertEqual([h[1] for h in context.help()], ['c', '<d>'])
+
+
+class TestConsole(unittest.TestCase):
+    """Test console output helpers."""
+    def setUp(self):
+        self._stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self._stdout
+
+    def test_print_table_blank_column(self):
+        from cly.console import print_table
+        print_table(['', 'x'], [], term_width=40)
+        self.assertEqual(sys.stdout.getvalue().strip(), 'x')
+
+
 def suite():
     import cly
     import cly.interactive
@@ -220,6 +385,9 @@ def suite():
 
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestXMLGrammar, 'test'))
+    suite.addTest(unittest.makeSuite(TestNode, 'test'))
+    suite.addTest(unittest.makeSuite(TestCacheInvalidation, 'test'))
+    suite.addTest(unittest.makeSuite(TestConsole, 'test'))
     suite.addTest(doctest.DocTestSuite(cly))
     suite.addTest(doctest.DocTestSuite(cly.interactive))
     suite.addTest(doctest.DocTestSuite(cly.console))
@@ -2,8 +2,10 @@ try:
     from setuptools import setup, Extension
 except ImportError:
     from distutils.core import setup, Extension
+import os
 import sys
 from distutils.command.build_ext import build_ext
+from distutils.command.install_lib import install_lib
 from distutils.errors import DistutilsPlatformError, CCompilerError
 
 class optional_build_ext(build_ext):
@@ -28,6 +30,23 @@ WARNING: Could not compile C extension, contextual help will not be available.
         print '*' * 78
 
 
+class compiled_install_lib(install_lib):
+    # Always install .pyc/.pyo files, even if the installing interpreter has
+    # bytecode writing disabled, so that shells started from read-only
+    # locations do not recompile cly on every run.
+    def byte_compile(self, files):
+        dont_write_bytecode = sys.dont_write_bytecode
+        # Optimised compilation runs in a child interpreter.
+        environ = os.environ.pop('PYTHONDONTWRITEBYTECODE', None)
+        sys.dont_write_bytecode = False
+        try:
+            install_lib.byte_compile(self, files)
+        finally:
+            sys.dont_write_bytecode = dont_write_bytecode
+            if environ is not None:
+                os.environ['PYTHONDONTWRITEBYTECODE'] = environ
+
+
 ext_modules = []
 install_requires = []
 
@@ -65,5 +84,6 @@ Kind of like the builtin "cmd" module on steroids.""",
                  'Topic :: Software Development :: Libraries'],
     ext_modules=ext_modules,
     install_requires=install_requires,
-    cmdclass={'build_ext': optional_build_ext},
+    cmdclass={'build_ext': optional_build_ext,
+              'install_lib': compiled_install_lib},
     )